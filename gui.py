@@ -4,6 +4,7 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 from typing import List, Dict
 from datetime import datetime
+from functools import lru_cache
 
 from dotenv import load_dotenv
 import pandas as pd
@@ -11,6 +12,7 @@ import pandas as pd
 from scraper.sirene import SireneClient
 
 
+@lru_cache(maxsize=1024)
 def generate_pappers_url(siren: str) -> str:
     """
     Génère une URL de recherche Pappers pour trouver le dirigeant.
@@ -170,6 +172,7 @@ class ScrapingApp:
                 secteur=secteur,
                 departement=departement,
                 limit=300,
+                active_only=False,
             )
             
             self.current_results = results
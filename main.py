@@ -1,12 +1,16 @@
+import asyncio
 import os
 import webbrowser
-from typing import List, Dict
-from urllib.parse import quote
+from collections import deque
+from typing import List, Dict, Optional
 
 from dotenv import load_dotenv
+import pandas as pd
 from rich.console import Console
+from rich.live import Live
 from rich.table import Table
 
+from scraper.pagesjaunes import PagesJaunesClient
 from scraper.sirene import SireneClient
 
 
@@ -35,35 +39,33 @@ def prompt_user_filters() -> Dict[str, str]:
     return {"secteur": secteur, "departement": departement}
 
 
-def generate_search_url(nom: str, adresse: str) -> str:
-    """
-    Génère une URL de recherche Google pour trouver le téléphone de l'entreprise.
-    Format: "nom entreprise adresse téléphone"
-    """
-    query = f"{nom} {adresse} téléphone"
-    encoded_query = quote(query)
-    return f"https://www.google.com/search?q={encoded_query}"
+# Champs des résultats SIRENE repris dans le tableau
+RESULT_FIELDS = ["nom", "adresse", "telephone", "secteur", "siret", "siren", "dirigeant", "effectif"]
+# Nombre de lignes affichées pendant la récupération des téléphones (dernières complétées)
+LIVE_ROWS = 15
 
 
-def generate_pappers_url(siren: str) -> str:
+def build_display_frame(results: List[Dict[str, str]]) -> pd.DataFrame:
     """
-    Génère une URL de recherche Pappers pour trouver le dirigeant.
-    Format: recherche par SIREN
+    Prépare les colonnes affichées (troncatures, liens Pappers) en opérations
+    vectorisées sur l'ensemble des résultats.
     """
-    if not siren or len(siren) < 9:
-        return ""
-    # Pappers utilise le SIREN dans l'URL
-    return f"https://www.pappers.fr/recherche?q={siren}"
+    df = pd.DataFrame(results).reindex(columns=RESULT_FIELDS).fillna("").astype(str)
+    df["nom"] = df["nom"].str[:40]
+    df["adresse"] = df["adresse"].str[:50]
+    df["dirigeant"] = df["dirigeant"].str[:30]
 
+    # Pappers utilise le SIREN dans l'URL (vide si le SIREN est incomplet)
+    df["pappers_url"] = "https://www.pappers.fr/recherche?q=" + df["siren"]
+    df.loc[df["siren"].str.len() < 9, "pappers_url"] = ""
+    df["pappers_link"] = ("[link=" + df["pappers_url"] + "]Ouvrir[/link]").where(df["pappers_url"] != "", "-")
+    return df
 
-def display_results(results: List[Dict[str, str]]) -> None:
+
+def new_results_table() -> Table:
     """
-    Affiche les résultats dans un tableau lisible pour les téléconseillers.
+    Crée le tableau (vide) des résultats avec ses colonnes.
     """
-    if not results:
-        console.print("[bold yellow]Aucune entreprise trouvée pour ces critères.[/bold yellow]")
-        return
-
     table = Table(show_header=True, header_style="bold magenta")
     table.add_column("N°", style="dim", width=3)
     table.add_column("Nom", style="cyan", no_wrap=True)
@@ -75,29 +77,88 @@ def display_results(results: List[Dict[str, str]]) -> None:
     table.add_column("Dirigeant")
     table.add_column("Effectif")
     table.add_column("👤 Pappers", style="cyan", width=10)
+    return table
 
-    for idx, ent in enumerate(results, 1):
-        nom = ent.get("nom", "")
-        siren = ent.get("siren", "")
-        
-        # Générer le lien Pappers
-        pappers_url = generate_pappers_url(siren)
-        
-        # Afficher le lien dans le tableau
-        pappers_link = f"[link={pappers_url}]Ouvrir[/link]" if pappers_url else "-"
+
+def add_result_row(table: Table, idx: int, row) -> None:
+    """
+    Ajoute une entreprise (ligne issue de `build_display_frame`) au tableau des résultats.
+    """
+    table.add_row(
+        str(idx),
+        row.nom,
+        row.adresse,
+        row.telephone,
+        row.secteur,
+        row.siret,
+        row.siren,
+        row.dirigeant,
+        row.effectif,
+        row.pappers_link,
+    )
+
+
+async def add_enriched_rows(
+    live: Live,
+    results: List[Dict[str, str]],
+    rows: list,
+    pending: List[int],
+    phone_client: PagesJaunesClient,
+) -> None:
+    """
+    Complète les téléphones manquants via l'API Pages Jaunes.
+    Chaque ligne complétée remplace la ligne d'origine dans `rows` (l'ordre des résultats
+    est conservé) ; les dernières lignes complétées sont affichées dans `live`.
+    """
+    companies = [(results[i].get("nom", ""), results[i].get("adresse", "")) for i in pending]
+    recent = deque(maxlen=LIVE_ROWS)
+    done = 0
+    add_row = add_result_row
+    async for pos, phone in phone_client.iter_phones_bulk(companies):
+        i = pending[pos]
+        if phone:
+            results[i]["telephone"] = phone
+            rows[i] = rows[i]._replace(telephone=phone)
+        recent.append(i)
+        done += 1
         
-        table.add_row(
-            str(idx),
-            nom[:40],
-            ent.get("adresse", "")[:50],
-            ent.get("telephone", ""),
-            ent.get("secteur", ""),
-            ent.get("siret", ""),
-            siren,
-            ent.get("dirigeant", "")[:30],
-            ent.get("effectif", ""),
-            pappers_link,
-        )
+        # Vue bornée : le tableau complet dépasserait la hauteur du terminal
+        table = new_results_table()
+        table.caption = f"Téléphones recherchés : {done}/{len(companies)}"
+        for j in recent:
+            add_row(table, j + 1, rows[j])
+        live.update(table)
+
+
+def display_results(results: List[Dict[str, str]], phone_client: Optional[PagesJaunesClient] = None) -> None:
+    """
+    Affiche les résultats dans un tableau lisible pour les téléconseillers.
+    Si `phone_client` est fourni, les téléphones manquants sont d'abord récupérés sur
+    Pages Jaunes (les dernières lignes complétées s'affichent au fur et à mesure des réponses),
+    puis le tableau complet est affiché dans l'ordre des résultats.
+    """
+    if not results:
+        console.print("[bold yellow]Aucune entreprise trouvée pour ces critères.[/bold yellow]")
+        return
+
+    df = build_display_frame(results)
+    rows = list(df.itertuples(index=False))
+    # Liens Pappers calculés une seule fois, réutilisés par les options ci-dessous
+    pappers_urls = df["pappers_url"].tolist()
+
+    if phone_client is not None:
+        pending = [i for i, row in enumerate(rows) if not row.telephone]
+        if pending:
+            # Affichage temporaire (transient) pendant l'enrichissement, effacé à la fin
+            with Live(console=console, refresh_per_second=8, transient=True) as live:
+                asyncio.run(add_enriched_rows(live, results, rows, pending, phone_client))
+
+    # Tableau complet imprimé une seule fois, lignes dans l'ordre des numéros
+    table = new_results_table()
+    # Références locales : évite les résolutions d'attributs à chaque ligne
+    add_row = add_result_row
+    for idx, row in enumerate(rows, 1):
+        add_row(table, idx, row)
 
     console.print(table)
     console.print(f"[bold green]{len(results)} entreprise(s) affichée(s).[/bold green]")
@@ -116,11 +177,11 @@ def display_results(results: List[Dict[str, str]]) -> None:
             break
         elif choice == "all":
             console.print("[bold cyan]Ouverture de tous les liens Pappers dans le navigateur...[/bold cyan]")
-            for ent in results:
-                siren = ent.get("siren", "")
-                pappers_url = generate_pappers_url(siren)
+            # Un seul contrôleur de navigateur pour tous les onglets
+            browser = webbrowser.get()
+            for pappers_url in pappers_urls:
                 if pappers_url:
-                    webbrowser.open(pappers_url)
+                    browser.open_new_tab(pappers_url)
             console.print(f"[bold green]✓ Liens Pappers ouverts dans votre navigateur.[/bold green]")
             break
         elif choice.isdigit():
@@ -128,8 +189,7 @@ def display_results(results: List[Dict[str, str]]) -> None:
             if 0 <= idx < len(results):
                 ent = results[idx]
                 nom = ent.get("nom", "")
-                siren = ent.get("siren", "")
-                pappers_url = generate_pappers_url(siren)
+                pappers_url = pappers_urls[idx]
                 if pappers_url:
                     webbrowser.open(pappers_url)
                     console.print(f"[bold green]✓ Pappers ouvert pour : {nom}[/bold green]")
@@ -164,9 +224,17 @@ def main() -> None:
         secteur=filters["secteur"],
         departement=filters["departement"],
         limit=300,
+        active_only=False,
     )
 
-    display_results(results)
+    # Enrichissement optionnel des téléphones si une clé Pages Jaunes est configurée
+    phone_client = None
+    pagesjaunes_api_key = os.getenv("PAGESJAUNES_API_KEY")
+    if pagesjaunes_api_key:
+        console.print("[bold cyan]Récupération des téléphones (Pages Jaunes)...[/bold cyan]")
+        phone_client = PagesJaunesClient(api_key=pagesjaunes_api_key)
+
+    display_results(results, phone_client)
 
 
 if __name__ == "__main__":
@@ -1,9 +1,31 @@
 import logging
+from collections import deque
+from functools import lru_cache
+from types import MappingProxyType
 from typing import Optional, Tuple
-import requests
+import diskcache
+import httpx
+import orjson
 
 logger = logging.getLogger(__name__)
 
+# Client HTTP partagé : HTTP/2, compression et connexions réutilisées vers France Compétences
+_CLIENT = httpx.Client(
+    headers={"Accept-Encoding": "gzip, br"},
+    timeout=5.0,
+    transport=httpx.HTTPTransport(
+        http2=True,
+        retries=2,
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=20),
+    ),
+)
+
+# Cache persistant (sur disque) des réponses France Compétences, partagé entre les exécutions
+_CACHE = diskcache.Cache(".cache/opco")
+_CACHE_EXPIRE = 30 * 86400  # 30 jours
+# Les SIRET inconnus (404, réponse vide) sont mémorisés moins longtemps
+_NEGATIVE_CACHE_EXPIRE = 3600  # 1 heure
+
 
 def get_opco_and_idcc_from_ape(ape_code: str, siret: str = "") -> Tuple[Optional[str], Optional[str]]:
     """
@@ -27,7 +49,7 @@ def get_opco_and_idcc_from_ape(ape_code: str, siret: str = "") -> Tuple[Optional
     siret = (siret or "").strip()
 
     # 1) Essayer d'abord France Compétences si on a un SIRET
-    if siret and siret.isdigit() and len(siret) >= 9:
+    if len(siret) >= 9 and siret.isascii() and siret.isdigit():
         try:
             opco_api, idcc_api = _get_from_france_competences(siret)
             if opco_api or idcc_api:
@@ -46,6 +68,26 @@ def get_opco_and_idcc_from_ape(ape_code: str, siret: str = "") -> Tuple[Optional
 
 
 def _get_from_france_competences(siret: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Renvoie (OPCO, IDCC) pour un SIRET, depuis le cache si possible,
+    sinon via l'API France Compétences.
+    Les résultats trouvés sont mis en cache 30 jours, les absences de résultat 1 heure.
+    Les erreurs de l'API (429, 5xx...) remontent à l'appelant sans être mises en cache.
+    """
+    key = ("fc", siret)
+    cached = _CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    opco, idcc = _fetch_from_france_competences(siret)
+    if opco or idcc:
+        _CACHE.set(key, (opco, idcc), expire=_CACHE_EXPIRE)
+    else:
+        _CACHE.set(key, (None, None), expire=_NEGATIVE_CACHE_EXPIRE)
+    return opco, idcc
+
+
+def _fetch_from_france_competences(siret: str) -> Tuple[Optional[str], Optional[str]]:
     """
     Appelle l'API France Compétences pour récupérer OPCO et IDCC
     à partir d'un SIRET.
@@ -54,15 +96,17 @@ def _get_from_france_competences(siret: str) -> Tuple[Optional[str], Optional[st
     https://api.francecompetences.fr/siro/v1/nico/search/{siret}
     """
     url = f"https://api.francecompetences.fr/siro/v1/nico/search/{siret}"
-    resp = requests.get(url, timeout=5)
-    if resp.status_code != 200:
+    resp = _CLIENT.get(url)
+    # SIRET inconnu ou réponse vide : absence de résultat (mise en cache)
+    if resp.status_code == 404:
         return None, None
-
-    try:
-        data = resp.json()
-    except ValueError:
+    # Autres erreurs (429, 5xx...) : levées pour ne pas être mises en cache
+    resp.raise_for_status()
+    if not resp.content.strip():
         return None, None
 
+    data = orjson.loads(resp.content)
+
     # La réponse peut être un objet ou une liste ; on parcours récursivement
     opco = _find_first_value_by_key(data, ["opco", "opco_nom", "opcoName", "opcoLibelle"])
     idcc = _find_first_value_by_key(data, ["idcc", "codeIdcc", "idccNumero"])
@@ -74,137 +118,158 @@ def _get_from_france_competences(siret: str) -> Tuple[Optional[str], Optional[st
     return opco, idcc
 
 
+_CONTAINER_TYPES = frozenset((dict, list))
+
+
 def _find_first_value_by_key(data, key_substrings) -> Optional[str]:
     """
-    Parcourt récursivement un JSON (dict/list) et renvoie la première valeur
+    Parcourt un JSON (dict/list) en largeur et renvoie la première valeur non vide
     dont la clé contient un des fragments donnés (insensible à la casse).
+    Les clés les moins profondes sont donc prioritaires.
     """
-    substrings = [s.lower() for s in key_substrings]
+    exact = frozenset(s.lower() for s in key_substrings)
+    substrings = tuple(exact)
 
-    def walk(obj):
-        if isinstance(obj, dict):
+    queue = deque([data])
+    while queue:
+        obj = queue.popleft()
+        # JSON décodé : types natifs exacts, on compare donc les types par identité
+        t = type(obj)
+        if t is dict:
             for k, v in obj.items():
-                k_low = str(k).lower()
-                if any(sub in k_low for sub in substrings):
-                    if isinstance(v, (str, int)):
-                        return str(v).strip()
-                res = walk(v)
-                if res:
-                    return res
-        elif isinstance(obj, list):
-            for item in obj:
-                res = walk(item)
-                if res:
-                    return res
-        return None
+                k_low = k.lower()
+                if k_low in exact or any(sub in k_low for sub in substrings):
+                    tv = type(v)
+                    if tv is str or tv is int:
+                        value = str(v).strip()
+                        if value:
+                            return value
+                if type(v) in _CONTAINER_TYPES:
+                    queue.append(v)
+        elif t is list:
+            queue.extend(obj)
+
+    return None
 
-    return walk(data)
 
+# Mapping partiel code APE -> IDCC, indexé par préfixe du code APE normalisé
+# (sans le point). La recherche retient le préfixe le plus long.
+# Source: correspondances APE -> IDCC courantes
+_APE_TO_IDCC = MappingProxyType({
+    # Commerce de détail
+    "4711": "2120",  # Commerce de détail alimentaire
+    "4719": "2120",  # Autre commerce de détail
+    "472": "2120",   # Commerce de détail alimentaire
+    "473": "2120",   # Commerce de détail de carburants
+    "474": "2120",   # Commerce de détail d'équipements
+    "475": "2120",   # Commerce de détail de meubles
+    "476": "2120",   # Commerce de détail de biens culturels
+    "477": "2120",   # Commerce de détail non spécialisé
 
+    # Hôtellerie-Restauration
+    "551": "1979",   # Hôtels
+    "552": "1979",   # Hébergement touristique
+    "553": "1979",   # Terrain de camping
+    "561": "1979",   # Restauration traditionnelle
+    "562": "1979",   # Restauration rapide
+    "563": "1979",   # Débits de boissons
+
+    # BTP
+    "41": "1596",    # Construction de bâtiments
+    "42": "1596",    # Génie civil
+    "43": "1596",    # Travaux spécialisés
+
+    # Industrie
+    "10": "1486",    # Industrie alimentaire
+    "11": "1486",    # Fabrication de boissons
+    "13": "1486",    # Fabrication de textiles
+    "14": "1486",    # Industrie de l'habillement
+    "15": "1486",    # Industrie du cuir
+    "16": "1486",    # Travail du bois
+    "17": "1486",    # Industrie du papier
+    "18": "1486",    # Imprimerie
+    "19": "1486",    # Cokéfaction
+    "20": "1486",    # Industrie chimique
+    "21": "1486",    # Industrie pharmaceutique
+    "22": "1486",    # Industrie du caoutchouc
+    "23": "1486",    # Industrie verrière
+    "24": "1486",    # Métallurgie
+    "25": "1486",    # Fabrication de produits métalliques
+    "26": "1486",    # Fabrication d'équipements informatiques
+    "27": "1486",    # Fabrication d'équipements électriques
+    "28": "1486",    # Fabrication de machines
+    "29": "1486",    # Fabrication de véhicules
+    "30": "1486",    # Fabrication d'autres équipements de transport
+    "31": "1486",    # Fabrication de meubles
+    "32": "1486",    # Autres industries manufacturières
+    "33": "1486",    # Réparation d'équipements
+
+    # Services
+    "68": "2120",    # Activités immobilières
+    "69": "2120",    # Activités juridiques
+    "70": "2120",    # Activités de sièges sociaux
+    "71": "2120",    # Activités d'architecture
+    "72": "2120",    # Recherche-développement
+    "73": "2120",    # Publicité
+    "74": "2120",    # Autres activités spécialisées
+    "77": "2120",    # Location
+    "78": "2120",    # Activités liées à l'emploi
+    "79": "2120",    # Agences de voyage
+    "80": "2120",    # Enquêtes et sécurité
+    "81": "2120",    # Services relatifs aux bâtiments
+    "82": "2120",    # Activités administratives
+    "85": "2120",    # Enseignement
+    "86": "2120",    # Activités pour la santé
+    "87": "2120",    # Hébergement médico-social
+    "88": "2120",    # Action sociale
+    "90": "2120",    # Arts
+    "91": "2120",    # Bibliothèques
+    "92": "2120",    # Jeux
+    "93": "2120",    # Activités sportives
+    "94": "2120",    # Activités des organisations
+    "95": "2120",    # Réparation d'ordinateurs
+    "96": "2120",    # Autres services personnels
+})
+
+# Mapping partiel IDCC -> OPCO
+# Source: correspondances IDCC -> OPCO courantes
+_IDCC_TO_OPCO = MappingProxyType({
+    # Commerce et services
+    "2120": "OPCO 2i",
+
+    # Hôtellerie-Restauration
+    "1979": "OPCO 2i",
+
+    # BTP
+    "1596": "OPCO Constructys",
+
+    # Industrie
+    "1486": "OPCO 2i",
+
+    # Autres conventions courantes : commerce de détail (1501 à 1517) et commerce de gros (1518)
+    **{str(idcc): "OPCO 2i" for idcc in range(1501, 1519)},
+})
+
+
+@lru_cache(maxsize=4096)
 def _get_idcc_from_ape(ape_code: str) -> Optional[str]:
     """
     Mapping partiel code APE -> IDCC.
     Ce mapping devrait être étendu avec une vraie base de données complète.
     """
-    # Normaliser le code APE (enlever les points et lettres)
+    # Normaliser le code APE (enlever les points, majuscules)
     ape_normalized = ape_code.replace(".", "").upper()
-    ape_prefix = ape_code.split(".")[0] if "." in ape_code else ape_code[:2]
-    
-    # Mapping partiel basé sur les grandes familles d'activités
-    # Source: correspondances APE -> IDCC courantes
-    mapping = {
-        # Commerce de détail
-        "4711": "2120",  # Commerce de détail alimentaire
-        "4719": "2120",  # Autre commerce de détail
-        "472": "2120",   # Commerce de détail alimentaire
-        "473": "2120",   # Commerce de détail de carburants
-        "474": "2120",   # Commerce de détail d'équipements
-        "475": "2120",   # Commerce de détail de meubles
-        "476": "2120",   # Commerce de détail de biens culturels
-        "477": "2120",   # Commerce de détail non spécialisé
-        
-        # Hôtellerie-Restauration
-        "551": "1979",   # Hôtels
-        "552": "1979",   # Hébergement touristique
-        "553": "1979",   # Terrain de camping
-        "561": "1979",   # Restauration traditionnelle
-        "562": "1979",   # Restauration rapide
-        "563": "1979",   # Débits de boissons
-        
-        # BTP
-        "41": "1596",    # Construction de bâtiments
-        "42": "1596",    # Génie civil
-        "43": "1596",    # Travaux spécialisés
-        
-        # Industrie
-        "10": "1486",    # Industrie alimentaire
-        "11": "1486",    # Fabrication de boissons
-        "13": "1486",    # Fabrication de textiles
-        "14": "1486",    # Industrie de l'habillement
-        "15": "1486",    # Industrie du cuir
-        "16": "1486",    # Travail du bois
-        "17": "1486",    # Industrie du papier
-        "18": "1486",    # Imprimerie
-        "19": "1486",    # Cokéfaction
-        "20": "1486",    # Industrie chimique
-        "21": "1486",    # Industrie pharmaceutique
-        "22": "1486",    # Industrie du caoutchouc
-        "23": "1486",    # Industrie verrière
-        "24": "1486",    # Métallurgie
-        "25": "1486",    # Fabrication de produits métalliques
-        "26": "1486",    # Fabrication d'équipements informatiques
-        "27": "1486",    # Fabrication d'équipements électriques
-        "28": "1486",    # Fabrication de machines
-        "29": "1486",    # Fabrication de véhicules
-        "30": "1486",    # Fabrication d'autres équipements de transport
-        "31": "1486",    # Fabrication de meubles
-        "32": "1486",    # Autres industries manufacturières
-        "33": "1486",    # Réparation d'équipements
-        
-        # Services
-        "68": "2120",    # Activités immobilières
-        "69": "2120",    # Activités juridiques
-        "70": "2120",    # Activités de sièges sociaux
-        "71": "2120",    # Activités d'architecture
-        "72": "2120",    # Recherche-développement
-        "73": "2120",    # Publicité
-        "74": "2120",    # Autres activités spécialisées
-        "77": "2120",    # Location
-        "78": "2120",    # Activités liées à l'emploi
-        "79": "2120",    # Agences de voyage
-        "80": "2120",    # Enquêtes et sécurité
-        "81": "2120",    # Services relatifs aux bâtiments
-        "82": "2120",    # Activités administratives
-        "85": "2120",    # Enseignement
-        "86": "2120",    # Activités pour la santé
-        "87": "2120",    # Hébergement médico-social
-        "88": "2120",    # Action sociale
-        "90": "2120",    # Arts
-        "91": "2120",    # Bibliothèques
-        "92": "2120",    # Jeux
-        "93": "2120",    # Activités sportives
-        "94": "2120",    # Activités des organisations
-        "95": "2120",    # Réparation d'ordinateurs
-        "96": "2120",    # Autres services personnels
-    }
-    
-    # Chercher d'abord le code complet
-    if ape_normalized in mapping:
-        return mapping[ape_normalized]
-    
-    # Chercher le préfixe à 2 chiffres
-    if ape_prefix in mapping:
-        return mapping[ape_prefix]
-    
-    # Chercher le préfixe à 3 chiffres
-    if len(ape_normalized) >= 3:
-        ape_3 = ape_normalized[:3]
-        if ape_3 in mapping:
-            return mapping[ape_3]
-    
+
+    # Chercher du préfixe le plus long (code complet) au plus court (2 chiffres)
+    for length in (5, 4, 3, 2):
+        idcc = _APE_TO_IDCC.get(ape_normalized[:length])
+        if idcc:
+            return idcc
+
     return None
 
 
+@lru_cache(maxsize=4096)
 def _get_opco_from_idcc(idcc: str) -> Optional[str]:
     """
     Mapping IDCC -> OPCO.
@@ -212,48 +277,5 @@ def _get_opco_from_idcc(idcc: str) -> Optional[str]:
     """
     if not idcc:
         return None
-    
-    idcc = str(idcc).strip()
-    
-    # Mapping partiel IDCC -> OPCO
-    # Source: correspondances IDCC -> OPCO courantes
-    mapping = {
-        # Commerce
-        "2120": "OPCO 2i",
-        
-        # Hôtellerie-Restauration
-        "1979": "OPCO 2i",
-        
-        # BTP
-        "1596": "OPCO Constructys",
-        
-        # Industrie
-        "1486": "OPCO 2i",
-        
-        # Services
-        "2120": "OPCO 2i",
-        
-        # Autres conventions courantes
-        "1518": "OPCO 2i",      # Commerce de gros
-        "1501": "OPCO 2i",      # Commerce de détail
-        "1502": "OPCO 2i",      # Commerce de détail
-        "1503": "OPCO 2i",      # Commerce de détail
-        "1504": "OPCO 2i",      # Commerce de détail
-        "1505": "OPCO 2i",      # Commerce de détail
-        "1506": "OPCO 2i",      # Commerce de détail
-        "1507": "OPCO 2i",      # Commerce de détail
-        "1508": "OPCO 2i",      # Commerce de détail
-        "1509": "OPCO 2i",      # Commerce de détail
-        "1510": "OPCO 2i",      # Commerce de détail
-        "1511": "OPCO 2i",      # Commerce de détail
-        "1512": "OPCO 2i",      # Commerce de détail
-        "1513": "OPCO 2i",      # Commerce de détail
-        "1514": "OPCO 2i",      # Commerce de détail
-        "1515": "OPCO 2i",      # Commerce de détail
-        "1516": "OPCO 2i",      # Commerce de détail
-        "1517": "OPCO 2i",      # Commerce de détail
-    }
-    
-    return mapping.get(idcc)
-
 
+    return _IDCC_TO_OPCO.get(str(idcc).strip())
@@ -1,11 +1,23 @@
+import asyncio
 import logging
 import re
-from typing import Optional, Dict, List
-import requests
+from typing import AsyncIterator, Optional, Dict, List, Tuple
+import diskcache
+import httpx
+import jmespath
+import orjson
 from urllib.parse import quote
 
 logger = logging.getLogger(__name__)
 
+# Octets à supprimer d'un numéro de téléphone : tout sauf les chiffres ASCII
+_NON_DIGIT_BYTES = bytes(b for b in range(256) if not 0x30 <= b <= 0x39)
+_CP_RE = re.compile(r'\b(\d{5})\b')
+
+# Cache persistant : conserve l'endpoint de recherche découvert entre deux exécutions
+_CACHE = diskcache.Cache(".cache/pagesjaunes")
+_ENDPOINT_CACHE_EXPIRE = 7 * 86400  # 7 jours
+
 
 class PagesJaunesClient:
     """
@@ -15,6 +27,25 @@ class PagesJaunesClient:
     BASE_URL = "https://api.pagesjaunes.fr/v1"
     SEARCH_PATH = "/search"
     PRO_PATH = "/pros"
+    # Endpoint de recherche utilisé par défaut
+    ENDPOINT_SEARCH = f"{BASE_URL}{SEARCH_PATH}"
+    # Endpoints candidats, testés une seule fois par `_discover_endpoint`
+    SEARCH_ENDPOINT_CANDIDATES = (
+        ENDPOINT_SEARCH,
+        f"{BASE_URL}/pros/search",
+    )
+    # Chemins possibles du téléphone dans une fiche professionnelle, du plus au moins précis
+    # (liste multisélection : chaque chemin est évalué, le premier texte non vide l'emporte)
+    PHONE_EXPR = jmespath.compile(
+        "[coordonnees.telephone, coordonnees.phone, coordonnees.tel,"
+        " contact.telephone, contact.phone, contact.tel,"
+        " phone, telephone, tel,"
+        " phones[0], telephones[0]]"
+    )
+    # Nombre maximal de requêtes simultanées vers Pages Jaunes lors des recherches groupées
+    MAX_CONCURRENCY = 20
+    # En-têtes envoyés sur toutes les connexions (réponses JSON compressées)
+    DEFAULT_HEADERS = {"Accept-Encoding": "gzip, br"}
 
     def __init__(self, api_key: Optional[str] = None):
         """
@@ -24,6 +55,55 @@ class PagesJaunesClient:
             api_key: Clé API Pages Jaunes (si nécessaire)
         """
         self.api_key = api_key
+        self._search_url: Optional[str] = None
+        # Client partagé par tous les appels synchrones (HTTP/2, connexions réutilisées)
+        self._client = httpx.Client(
+            headers=self.DEFAULT_HEADERS,
+            transport=httpx.HTTPTransport(
+                http2=True,
+                retries=2,
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=20),
+            ),
+        )
+
+    def _headers(self) -> Dict[str, str]:
+        """En-têtes HTTP communs à tous les appels Pages Jaunes."""
+        headers = {}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        else:
+            # Certaines API utilisent des headers différents
+            headers["Accept"] = "application/json"
+        return headers
+
+    def _discover_endpoint(self) -> str:
+        """
+        Détermine (une seule fois) l'endpoint de recherche qui répond.
+        Le résultat est gardé sur l'instance et dans le cache disque ;
+        à défaut, ENDPOINT_SEARCH est utilisé.
+        """
+        if self._search_url:
+            return self._search_url
+
+        cache_key = ("search_endpoint", self.BASE_URL)
+        url = _CACHE.get(cache_key)
+        if url:
+            self._search_url = url
+            return url
+
+        headers = self._headers()
+        for candidate in self.SEARCH_ENDPOINT_CANDIDATES:
+            try:
+                response = self._client.get(candidate, params={"what": "", "where": ""}, headers=headers, timeout=10)
+            except httpx.HTTPError:
+                continue
+            if response.status_code != 404:
+                _CACHE.set(cache_key, candidate, expire=_ENDPOINT_CACHE_EXPIRE)
+                self._search_url = candidate
+                return candidate
+
+        self._search_url = self.ENDPOINT_SEARCH
+        return self._search_url
 
     def search_pro(self, nom: str, adresse: str = "", code_postal: str = "") -> Optional[str]:
         """
@@ -43,73 +123,28 @@ class PagesJaunesClient:
         
         # Extraire le code postal de l'adresse si fourni
         if not code_postal and adresse:
-            cp_match = re.search(r'\b(\d{5})\b', adresse)
+            cp_match = _CP_RE.search(adresse)
             if cp_match:
                 code_postal = cp_match.group(1)
         
-        # Essayer différentes méthodes de recherche
-        pro_id = None
-        
         # Méthode 1: API de recherche Pages Jaunes
         try:
             params = {
                 "what": nom,
                 "where": code_postal if code_postal else adresse
             }
+            headers = self._headers()
             
-            headers = {}
-            if self.api_key:
-                headers["Authorization"] = f"Bearer {self.api_key}"
-            else:
-                # Certaines API utilisent des headers différents
-                headers["Accept"] = "application/json"
+            url = self._discover_endpoint()
+            response = self._client.get(url, params=params, headers=headers, timeout=10)
             
-            # Essayer différents endpoints de recherche possibles
-            search_endpoints = [
-                f"{self.BASE_URL}{self.SEARCH_PATH}",
-                f"{self.BASE_URL}/search",
-                f"{self.BASE_URL}/pros/search"
-            ]
-            
-            for url in search_endpoints:
-                try:
-                    response = requests.get(url, params=params, headers=headers, timeout=10)
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        
-                        # Chercher le pro_id dans différentes structures de réponse
-                        if isinstance(data, dict):
-                            # Structure: {"results": [{"id": "...", ...}, ...]}
-                            results = data.get("results") or data.get("data") or data.get("items") or []
-                            if results and isinstance(results, list):
-                                for result in results:
-                                    if isinstance(result, dict):
-                                        pro_id = result.get("id") or result.get("pro_id") or result.get("proId")
-                                        if pro_id:
-                                            return str(pro_id)
-                            
-                            # Structure: {"pro_id": "...", ...} directement
-                            pro_id = data.get("id") or data.get("pro_id") or data.get("proId")
-                            if pro_id:
-                                return str(pro_id)
-                        
-                        elif isinstance(data, list):
-                            # Structure: [{"id": "...", ...}, ...]
-                            for result in data:
-                                if isinstance(result, dict):
-                                    pro_id = result.get("id") or result.get("pro_id") or result.get("proId")
-                                    if pro_id:
-                                        return str(pro_id)
-                    
-                    elif response.status_code == 404:
-                        # Endpoint n'existe pas, essayer le suivant
-                        continue
-                        
-                except requests.exceptions.RequestException:
-                    # Erreur de requête, essayer le suivant
-                    continue
+            if response.status_code == 200:
+                pro_id = self._extract_pro_id(orjson.loads(response.content))
+                if pro_id:
+                    return pro_id
             
+        except httpx.HTTPError as e:
+            logger.debug(f"Erreur de requête lors de la recherche Pages Jaunes pour {nom}: {e}")
         except Exception as e:
             logger.debug(f"Erreur lors de la recherche API Pages Jaunes pour {nom}: {e}")
         
@@ -132,66 +167,15 @@ class PagesJaunesClient:
             return None
         
         try:
-            headers = {}
-            if self.api_key:
-                headers["Authorization"] = f"Bearer {self.api_key}"
-            else:
-                headers["Accept"] = "application/json"
-            
             url = f"{self.BASE_URL}{self.PRO_PATH}/{pro_id}"
-            response = requests.get(url, headers=headers, timeout=10)
+            response = self._client.get(url, headers=self._headers(), timeout=10)
             
             if response.status_code == 200:
-                data = response.json()
-                
-                # Extraire le numéro de téléphone selon différentes structures possibles
-                phone = None
-                
-                if isinstance(data, dict):
-                    # Chercher dans différents chemins possibles
-                    paths_to_check = [
-                        ["coordonnees", "telephone"],
-                        ["coordonnees", "phone"],
-                        ["coordonnees", "tel"],
-                        ["contact", "telephone"],
-                        ["contact", "phone"],
-                        ["contact", "tel"],
-                        ["phone"],
-                        ["telephone"],
-                        ["tel"],
-                        ["phones", 0],  # Premier élément si c'est une liste
-                        ["telephones", 0],
-                    ]
-                    
-                    for path in paths_to_check:
-                        value = data
-                        try:
-                            for key in path:
-                                if isinstance(value, (list, tuple)) and isinstance(key, int):
-                                    if 0 <= key < len(value):
-                                        value = value[key]
-                                    else:
-                                        value = None
-                                        break
-                                elif isinstance(value, dict):
-                                    value = value.get(key)
-                                else:
-                                    value = None
-                                    break
-                            
-                            if value and isinstance(value, str) and value.strip():
-                                phone = value.strip()
-                                break
-                        except (KeyError, IndexError, TypeError, AttributeError):
-                            continue
-                    
-                    # Formater le numéro si trouvé
-                    if phone:
-                        return self._format_phone(phone)
+                return self._extract_phone(orjson.loads(response.content))
             
             return None
             
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logger.debug(f"Erreur de requête lors de la récupération du téléphone pour pro_id {pro_id}: {e}")
             return None
         except Exception as e:
@@ -212,7 +196,7 @@ class PagesJaunesClient:
         # Recherche du pro_id
         code_postal = ""
         if adresse:
-            cp_match = re.search(r'\b(\d{5})\b', adresse)
+            cp_match = _CP_RE.search(adresse)
             if cp_match:
                 code_postal = cp_match.group(1)
         
@@ -224,6 +208,155 @@ class PagesJaunesClient:
         # Récupération du téléphone
         return self.get_pro_phone(pro_id)
 
+    async def search_pro_async(
+        self, client: httpx.AsyncClient, nom: str, adresse: str = "", code_postal: str = ""
+    ) -> Optional[str]:
+        """
+        Version asynchrone de `search_pro`, à utiliser avec un client httpx asynchrone partagé.
+        """
+        if not nom:
+            return None
+            
+        if not code_postal and adresse:
+            cp_match = _CP_RE.search(adresse)
+            if cp_match:
+                code_postal = cp_match.group(1)
+                
+        params = {
+            "what": nom,
+            "where": code_postal if code_postal else adresse
+        }
+        headers = self._headers()
+        
+        # L'endpoint est découvert (de façon synchrone) par `iter_phones_bulk` avant l'envoi du lot
+        url = self._search_url or self.ENDPOINT_SEARCH
+        try:
+            response = await client.get(url, params=params, headers=headers, timeout=10)
+            if response.status_code == 200:
+                pro_id = self._extract_pro_id(orjson.loads(response.content))
+                if pro_id:
+                    return pro_id
+        except (httpx.HTTPError, ValueError) as e:
+            logger.debug(f"Erreur lors de la recherche API Pages Jaunes pour {nom}: {e}")
+            
+        return None
+
+    async def get_pro_phone_async(self, client: httpx.AsyncClient, pro_id: str) -> Optional[str]:
+        """
+        Version asynchrone de `get_pro_phone`, à utiliser avec un client httpx asynchrone partagé.
+        """
+        if not pro_id:
+            return None
+            
+        try:
+            url = f"{self.BASE_URL}{self.PRO_PATH}/{pro_id}"
+            response = await client.get(url, headers=self._headers(), timeout=10)
+            if response.status_code == 200:
+                return self._extract_phone(orjson.loads(response.content))
+            return None
+        except Exception as e:
+            logger.debug(f"Erreur lors de la récupération du téléphone pour pro_id {pro_id}: {e}")
+            return None
+
+    async def get_phone_for_company_async(
+        self, client: httpx.AsyncClient, nom: str, adresse: str = ""
+    ) -> Optional[str]:
+        """
+        Version asynchrone de `get_phone_for_company`.
+        """
+        pro_id = await self.search_pro_async(client, nom, adresse)
+        if not pro_id:
+            return None
+        return await self.get_pro_phone_async(client, pro_id)
+
+    async def iter_phones_bulk(
+        self, companies: List[Tuple[str, str]]
+    ) -> AsyncIterator[Tuple[int, Optional[str]]]:
+        """
+        Récupère les téléphones d'un lot d'entreprises en parallèle et produit
+        les couples (index, téléphone) au fur et à mesure des réponses.
+        Le nombre de requêtes simultanées est borné par MAX_CONCURRENCY.
+        
+        Args:
+            companies: Liste de tuples (nom, adresse)
+            
+        Yields:
+            (index dans `companies`, numéro formaté ou None), dans l'ordre d'arrivée
+        """
+        # Une seule recherche par couple (nom, adresse) distinct
+        indexes_by_company: Dict[Tuple[str, str], List[int]] = {}
+        for index, company in enumerate(companies):
+            indexes_by_company.setdefault(company, []).append(index)
+            
+        self._discover_endpoint()
+        semaphore = asyncio.Semaphore(self.MAX_CONCURRENCY)
+        
+        async def lookup(
+            client: httpx.AsyncClient, company: Tuple[str, str]
+        ) -> Tuple[Tuple[str, str], Optional[str]]:
+            async with semaphore:
+                return company, await self.get_phone_for_company_async(client, *company)
+                
+        limits = httpx.Limits(max_connections=self.MAX_CONCURRENCY)
+        async with httpx.AsyncClient(http2=True, limits=limits, headers=self.DEFAULT_HEADERS) as client:
+            for future in asyncio.as_completed([lookup(client, company) for company in indexes_by_company]):
+                company, phone = await future
+                for index in indexes_by_company[company]:
+                    yield index, phone
+
+    @staticmethod
+    def _extract_pro_id(data) -> Optional[str]:
+        """
+        Cherche le pro_id dans les différentes structures de réponse possibles.
+        """
+        # JSON décodé : types natifs exacts, on compare donc les types par identité
+        t = type(data)
+        if t is dict:
+            # Structure: {"results": [{"id": "...", ...}, ...]}
+            results = data.get("results") or data.get("data") or data.get("items") or []
+            if results and type(results) is list:
+                for result in results:
+                    if type(result) is dict:
+                        pro_id = result.get("id") or result.get("pro_id") or result.get("proId")
+                        if pro_id:
+                            return str(pro_id)
+                            
+            # Structure: {"pro_id": "...", ...} directement
+            pro_id = data.get("id") or data.get("pro_id") or data.get("proId")
+            if pro_id:
+                return str(pro_id)
+                
+        elif t is list:
+            # Structure: [{"id": "...", ...}, ...]
+            for result in data:
+                if type(result) is dict:
+                    pro_id = result.get("id") or result.get("pro_id") or result.get("proId")
+                    if pro_id:
+                        return str(pro_id)
+                        
+        return None
+
+    @classmethod
+    def _extract_phone(cls, data) -> Optional[str]:
+        """
+        Extrait et formate le numéro de téléphone selon différentes structures possibles.
+        """
+        if type(data) is not dict:
+            return None
+            
+        # Chemins possibles évalués dans l'ordre par l'expression compilée PHONE_EXPR
+        phone = None
+        for candidate in cls.PHONE_EXPR.search(data):
+            if type(candidate) is str and candidate.strip():
+                phone = candidate.strip()
+                break
+            
+        # Formater le numéro si trouvé
+        if phone:
+            return cls._format_phone(phone)
+            
+        return None
+
     @staticmethod
     def _format_phone(phone: str) -> str:
         """
@@ -239,7 +372,7 @@ class PagesJaunesClient:
             return ""
         
         # Nettoyer le numéro (garder uniquement les chiffres)
-        digits = re.sub(r'\D', '', phone)
+        digits = phone.encode().translate(None, _NON_DIGIT_BYTES).decode()
         
         # Si c'est un numéro français (10 chiffres commençant par 0)
         if len(digits) == 10 and digits.startswith('0'):
@@ -254,4 +387,3 @@ class PagesJaunesClient:
         
         # Retourner tel quel si format non reconnu
         return phone
-
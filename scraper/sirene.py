@@ -1,11 +1,25 @@
 import logging
-from typing import List, Dict, Optional
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Dict, Optional
 
-import requests
+import diskcache
+from cachetools import TTLCache
+import httpx
+import orjson
 
 
 logger = logging.getLogger(__name__)
 
+# Cache persistant (sur disque) des recherches abouties, partagé entre processus et exécutions
+_CACHE = diskcache.Cache(".cache/sirene")
+_CACHE_EXPIRE = 3600  # 1 heure
+# Cache mémoire devant le cache disque : recherches répétées servies sans lecture disque
+_MEMORY_CACHE = TTLCache(maxsize=256, ttl=300)  # 5 minutes
+_MEMORY_CACHE_LOCK = threading.Lock()
+
 
 TRANCHE_EFFECTIFS_LABELS = {
     "NN": "Unité non-employeuse ou effectif inconnu",
@@ -26,6 +40,32 @@ TRANCHE_EFFECTIFS_LABELS = {
     "53": "10 000 salariés et plus",
 }
 
+# États administratifs : "A" = Actif, "F" = Fermé, "C" = Cessé, etc.
+ETAT_ADMINISTRATIF_LABELS = {
+    "A": "Actif",
+    "F": "Fermé",
+    "C": "Cessé",
+}
+
+
+def _etat_final(etat_etablissement: str, etat_unite: str) -> str:
+    """
+    État affiché à partir des codes de l'établissement et de l'unité légale :
+    "Actif" si les deux sont actifs, "Fermé" si seule l'unité légale ne l'est plus,
+    sinon le statut de l'établissement.
+    """
+    if etat_etablissement == "A":
+        return "Actif" if etat_unite == "A" else "Fermé"
+    return ETAT_ADMINISTRATIF_LABELS.get(etat_etablissement, etat_etablissement or "Inconnu")
+
+
+# Toutes les combinaisons des codes connus (et de l'absence de code), calculées une fois
+_ETAT_MATRIX = {
+    (etat_etablissement, etat_unite): _etat_final(etat_etablissement, etat_unite)
+    for etat_etablissement in (*ETAT_ADMINISTRATIF_LABELS, "")
+    for etat_unite in (*ETAT_ADMINISTRATIF_LABELS, "")
+}
+
 
 class SireneClient:
     """
@@ -40,21 +80,49 @@ class SireneClient:
     # URL d'accès indiquée sur la page de l'API (ex: https://api.insee.fr/api-sirene/3.11)
     BASE_URL = "https://api.insee.fr/api-sirene/3.11"
     SIRET_SEARCH_PATH = "/siret"
+    # Nombre maximal d'établissements par page autorisé par l'API
+    PAGE_SIZE = 1000
+    # Nombre maximal de pages demandées simultanément (respect des quotas INSEE)
+    MAX_CONCURRENT_PAGES = 8
+    # Réponses HTTP donnant lieu à un nouvel essai, et nombre maximal de nouveaux essais
+    RETRY_STATUSES = frozenset({429, 502, 503, 504})
+    MAX_RETRIES = 3
 
     def __init__(self, api_key: Optional[str] = None, api_secret: Optional[str] = None):
         self.api_key = api_key
+        
+        # Client persistant en HTTP/2 : les pages demandées en parallèle partagent
+        # une seule connexion TLS vers api.insee.fr
+        headers = {
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip, br",
+        }
+        # Clé telle qu'indiquée dans l'exemple cURL du portail :
+        # curl --header "X-INSEE-Api-Key-Integration: VOTRE_CLE" ...
+        if api_key:
+            headers["X-INSEE-Api-Key-Integration"] = api_key
+        self._client = httpx.Client(
+            headers=headers,
+            timeout=15.0,
+            transport=httpx.HTTPTransport(
+                http2=True,
+                retries=2,
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            ),
+        )
 
     def _is_demo(self) -> bool:
         # En l'absence de clé, on reste en mode démo.
         return not self.api_key
 
     def search_by_secteur_and_departement(
-        self, secteur: str, departement: str, limit: int = 300
+        self, secteur: str, departement: str, limit: int = 300, active_only: bool = True
     ) -> List[Dict[str, str]]:
         """
         Recherche d'entreprises par secteur (mot-clé ou code NAF) et département.
         - En mode démo : renvoie quelques entreprises factices.
         - En mode API : interroge l'API Sirene (simplifiée).
+        - Avec `active_only`, seuls les établissements à l'état "Actif" sont renvoyés.
         """
         if self._is_demo():
             return self._demo_results(secteur, departement)
@@ -72,68 +140,77 @@ class SireneClient:
             # Recherche texte approximative sur la dénomination + département
             q = f"denominationUniteLegale:{secteur}* AND codePostalEtablissement:{departement}*"
 
-        params = {
-            "q": q,
-            "nombre": min(limit, 1000),
-        }
-        # Clé telle qu'indiquée dans l'exemple cURL du portail :
-        # curl --header "X-INSEE-Api-Key-Integration: VOTRE_CLE" ...
-        headers = {"X-INSEE-Api-Key-Integration": self.api_key}
+        # Même requête relancée : réponse servie depuis le cache (clé = requête envoyée)
+        key = ("search", q, limit, active_only)
+        with _MEMORY_CACHE_LOCK:
+            cached = _MEMORY_CACHE.get(key)
+        if cached is None:
+            cached = _CACHE.get(key)
+            if cached is not None:
+                with _MEMORY_CACHE_LOCK:
+                    _MEMORY_CACHE[key] = cached
+        if cached is not None:
+            # Copies : les appelants peuvent compléter les fiches (téléphone...) sans toucher au cache
+            return [dict(ent) for ent in cached]
 
         try:
-            url = f"{self.BASE_URL}{self.SIRET_SEARCH_PATH}"
-            resp = requests.get(url, headers=headers, params=params, timeout=15)
-            resp.raise_for_status()
-            data = resp.json()
-            # L'API peut retourner les établissements directement ou dans une structure imbriquée
-            if "etablissements" in data:
-                # Format: {"etablissements": [{"etablissement": {...}}, ...]}
-                etablissements_raw = data.get("etablissements", [])
-                # Si les établissements sont dans une structure {"etablissement": {...}}
-                etablissements = []
-                for item in etablissements_raw:
-                    if "etablissement" in item:
-                        etablissements.append(item["etablissement"])
-                    else:
-                        etablissements.append(item)
-            else:
-                etablissements = []
+            etablissements = self._fetch_etablissements(q, limit)
         except Exception as exc:
             logger.error("Erreur lors de l'appel à l'API SIRENE: %s", exc)
             return self._demo_results(secteur, departement)
 
         results: List[Dict[str, str]] = []
+        # Références locales : évite les résolutions d'attributs à chaque établissement
+        tranche_label = TRANCHE_EFFECTIFS_LABELS.get
+        etat_matrix = _ETAT_MATRIX.get
 
         for e in etablissements[:limit]:
-            # Accéder à l'unité légale (peut être directement ou dans une structure)
-            if "uniteLegale" in e:
-                if isinstance(e["uniteLegale"], dict):
-                    unite = e["uniteLegale"]
-                else:
-                    unite = {}
-            else:
+            # Accéder à l'unité légale et à l'adresse (objets imbriqués, absents parfois)
+            unite = e.get("uniteLegale")
+            if type(unite) is not dict:
                 unite = {}
-            
-            # Accéder à l'adresse
-            if "adresseEtablissement" in e:
-                adresse = e["adresseEtablissement"] if isinstance(e["adresseEtablissement"], dict) else {}
-            else:
+            adresse = e.get("adresseEtablissement")
+            if type(adresse) is not dict:
                 adresse = {}
 
+            # Récupérer l'état administratif de l'établissement et de l'unité légale
+            # Essayer d'abord directement dans l'établissement, sinon dans la période courante :
+            # l'API Sirene v3 trie les périodes de la plus récente à la plus ancienne,
+            # seule la première est donc lue.
+            etat_etablissement = e.get("etatAdministratifEtablissement") or ""
+            if not etat_etablissement:
+                periodes = e.get("periodesEtablissement")
+                if periodes and type(periodes) is list and type(periodes[0]) is dict:
+                    etat_etablissement = periodes[0].get("etatAdministratifEtablissement") or ""
+            
+            # Pour l'unité légale, chercher directement ou dans periodesUniteLegale
+            etat_unite = unite.get("etatAdministratifUniteLegale") or ""
+            if not etat_unite:
+                periodes_ul = unite.get("periodesUniteLegale")
+                if periodes_ul and type(periodes_ul) is list and type(periodes_ul[0]) is dict:
+                    etat_unite = periodes_ul[0].get("etatAdministratifUniteLegale") or ""
+            
+            # Déterminer l'état affiché (table précalculée, règle complète pour les codes inconnus)
+            etat_final = etat_matrix((etat_etablissement, etat_unite)) or _etat_final(etat_etablissement, etat_unite)
+            
+            # Établissement inactif : ignoré avant de construire le reste de la fiche
+            if active_only and etat_final != "Actif":
+                continue
+
             nom = (
                 unite.get("denominationUniteLegale")
                 or unite.get("nomUniteLegale")
                 or ""
-            )
+            ).strip()
 
             voie = adresse.get("libelleVoieEtablissement", "") or ""
             cp = adresse.get("codePostalEtablissement", "") or ""
             commune = adresse.get("libelleCommuneEtablissement", "") or ""
             adresse_full = f"{voie}, {cp} {commune}".strip(", ")
 
-            siret = e.get("siret", "") or ""
+            siret = (e.get("siret", "") or "").strip()
             # On essaie de récupérer le SIREN, sinon on le déduit des 9 premiers chiffres du SIRET
-            siren = unite.get("siren") or (siret[:9] if len(siret) >= 9 else "")
+            siren = (unite.get("siren") or "").strip() or (siret[:9] if len(siret) >= 9 else "")
 
             effectif_code = e.get("trancheEffectifsEtablissement", "") or ""
             # Si aucune info ou code 'NN' -> on affiche "0 à 1" au lieu de "NN"
@@ -141,65 +218,16 @@ class SireneClient:
                 effectif_label = "0 à 1"
             else:
                 # Sinon on essaie de traduire le code en texte lisible
-                effectif_label = TRANCHE_EFFECTIFS_LABELS.get(
-                    effectif_code, effectif_code
-                )
-            
-            # Récupérer l'état administratif de l'établissement et de l'unité légale
-            # Dans l'API Sirene v3, l'état est souvent dans periodesEtablissement (dernière période)
-            etat_etablissement = ""
-            etat_unite = ""
-            
-            # Essayer d'abord directement dans l'établissement
-            etat_etablissement = e.get("etatAdministratifEtablissement") or ""
-            
-            # Si pas trouvé, chercher dans periodesEtablissement (dernière période = la plus récente)
-            if not etat_etablissement and "periodesEtablissement" in e:
-                periodes = e.get("periodesEtablissement", [])
-                if periodes and isinstance(periodes, list) and len(periodes) > 0:
-                    # Prendre la dernière période (la plus récente)
-                    derniere_periode = periodes[-1]
-                    if isinstance(derniere_periode, dict):
-                        etat_etablissement = derniere_periode.get("etatAdministratifEtablissement", "") or ""
-            
-            # Pour l'unité légale, chercher directement ou dans periodesUniteLegale
-            etat_unite = unite.get("etatAdministratifUniteLegale") or ""
-            
-            # Si pas trouvé, chercher dans periodesUniteLegale
-            if not etat_unite and "periodesUniteLegale" in unite:
-                periodes_ul = unite.get("periodesUniteLegale", [])
-                if periodes_ul and isinstance(periodes_ul, list) and len(periodes_ul) > 0:
-                    derniere_periode_ul = periodes_ul[-1]
-                    if isinstance(derniere_periode_ul, dict):
-                        etat_unite = derniere_periode_ul.get("etatAdministratifUniteLegale", "") or ""
-            
-            # Déterminer l'état affiché
-            # "A" = Actif, "F" = Fermé, "C" = Cessé, etc.
-            etat_labels = {
-                "A": "Actif",
-                "F": "Fermé",
-                "C": "Cessé",
-            }
-            etat_etablissement_label = etat_labels.get(etat_etablissement, etat_etablissement or "Inconnu")
-            etat_unite_label = etat_labels.get(etat_unite, etat_unite or "Inconnu")
+                effectif_label = tranche_label(effectif_code, effectif_code)
             
-            # Afficher l'état : si les deux sont actifs, afficher "Actif", sinon le statut de l'établissement
-            if etat_etablissement == "A" and etat_unite == "A":
-                etat_final = "Actif"
-            elif etat_etablissement != "A":
-                etat_final = etat_etablissement_label
-            elif etat_etablissement == "A" and etat_unite != "A":
-                # Si l'établissement est actif mais l'unité légale est cessée/fermée, considérer comme Fermé
-                etat_final = "Fermé"
-            else:
-                etat_final = f"{etat_etablissement_label} / {etat_unite_label}"
-
+            # Valeurs toujours des chaînes sans espaces superflus : aucun nettoyage en aval
             results.append(
                 {
                     "nom": nom,
                     "adresse": adresse_full,
                     "telephone": "",  # L'API Sirene ne fournit pas le téléphone
-                    "secteur": unite.get("activitePrincipaleUniteLegale", "") or "",
+                    # Code NAF très répété d'une fiche à l'autre : une seule chaîne partagée
+                    "secteur": sys.intern((unite.get("activitePrincipaleUniteLegale", "") or "").strip()),
                     "siret": siret,
                     "siren": siren,
                     "dirigeant": "",  # Nécessiterait une autre source (INPI, Pappers, etc.)
@@ -208,8 +236,63 @@ class SireneClient:
                 }
             )
 
+        # Seuls les résultats de l'API sont mis en cache (jamais les données de démo)
+        _CACHE.set(key, results, expire=_CACHE_EXPIRE)
+        with _MEMORY_CACHE_LOCK:
+            _MEMORY_CACHE[key] = [dict(ent) for ent in results]
         return results
 
+    def _fetch_page(self, q: str, debut: int, nombre: int) -> Dict[str, Any]:
+        """
+        Récupère une page de résultats (`nombre` établissements à partir de `debut`).
+        """
+        params = {
+            "q": q,
+            "nombre": nombre,
+            "debut": debut,
+        }
+        url = f"{self.BASE_URL}{self.SIRET_SEARCH_PATH}"
+        # Quota dépassé ou passerelle indisponible : nouvel essai avec attente croissante
+        for attempt in range(self.MAX_RETRIES + 1):
+            resp = self._client.get(url, params=params)
+            if resp.status_code not in self.RETRY_STATUSES or attempt == self.MAX_RETRIES:
+                break
+            time.sleep(0.3 * 2 ** attempt)
+        resp.raise_for_status()
+        # orjson directement sur les octets de la réponse
+        return orjson.loads(resp.content)
+
+    def _fetch_etablissements(self, q: str, limit: int) -> List[Dict[str, Any]]:
+        """
+        Récupère jusqu'à `limit` établissements.
+        La première page donne le nombre total de résultats ; les pages suivantes
+        sont ensuite demandées en parallèle puis fusionnées dans l'ordre.
+        """
+        page_size = min(limit, self.PAGE_SIZE)
+        first_page = self._fetch_page(q, 0, page_size)
+        pages = [first_page]
+        
+        header = first_page.get("header") or {}
+        total = min(limit, int(header.get("total") or 0))
+        offsets = range(page_size, total, page_size)
+        if offsets:
+            with ThreadPoolExecutor(max_workers=self.MAX_CONCURRENT_PAGES) as pool:
+                pages.extend(
+                    pool.map(lambda debut: self._fetch_page(q, debut, min(page_size, total - debut)), offsets)
+                )
+                
+        etablissements = []
+        for data in pages:
+            # L'API peut retourner les établissements directement ou dans une structure imbriquée
+            # Format: {"etablissements": [{"etablissement": {...}}, ...]}
+            for item in data.get("etablissements", []):
+                # Si les établissements sont dans une structure {"etablissement": {...}}
+                if "etablissement" in item:
+                    etablissements.append(item["etablissement"])
+                else:
+                    etablissements.append(item)
+        return etablissements
+
     @staticmethod
     def _demo_results(secteur: str, departement: str) -> List[Dict[str, str]]:
         """
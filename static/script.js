@@ -88,6 +88,26 @@ function saveField(siret, field, value) {
     return true;
 }
 
+// Liens externes (mêmes règles que generate_*_url dans web.py, utilisées pour l'export)
+function generatePappersUrl(siren) {
+    if (!siren || siren.length < 9) return '';
+    return `https://www.pappers.fr/recherche?q=${siren}`;
+}
+
+function generatePagesJaunesUrl(nom, adresse) {
+    if (!nom) return '';
+    // Sans code postal, le lien serait moins précis ; on préfère ne rien mettre
+    const match = (adresse || '').match(/\b(\d{5})\b/);
+    if (!match) return '';
+    return `https://www.pagesjaunes.fr/recherche/${match[1]}/${encodeURIComponent(nom.trim())}`;
+}
+
+function generateOpcoUrl(siret) {
+    siret = String(siret || '').trim();
+    if (!/^\d{14}$/.test(siret)) return '';
+    return `https://quel-est-mon-opco.francecompetences.fr/?siret=${siret}`;
+}
+
 document.getElementById('searchBtn').addEventListener('click', searchCompanies);
 document.getElementById('exportBtn').addEventListener('click', exportToExcel);
 
@@ -160,19 +180,24 @@ function displayResults(results) {
     results.forEach((ent, index) => {
         const row = document.createElement('tr');
         
+        // Liens construits dans le navigateur (non transmis par /api/search)
+        const pagesjaunesUrl = generatePagesJaunesUrl(ent.nom, ent.adresse);
+        const opcoUrl = generateOpcoUrl(ent.siret);
+        const pappersUrl = generatePappersUrl(ent.siren);
+        
         // Lien PagesJaunes pour le téléphone
-        const pjLink = ent.pagesjaunes_url 
-            ? `<a href="${ent.pagesjaunes_url}" target="_blank" class="pappers-link" style="background: #ffcc00; color: #000;">PagesJaunes</a>`
+        const pjLink = pagesjaunesUrl 
+            ? `<a href="${pagesjaunesUrl}" target="_blank" class="pappers-link" style="background: #ffcc00; color: #000;">PagesJaunes</a>`
             : '-';
         
         // Lien OPCO (France Compétences)
-        const opcoLink = ent.opco_url
-            ? `<a href="${ent.opco_url}" target="_blank" class="pappers-link" style="background: linear-gradient(135deg, #2196f3 0%, #00bcd4 100%); color: #fff;">OPCO</a>`
+        const opcoLink = opcoUrl
+            ? `<a href="${opcoUrl}" target="_blank" class="pappers-link" style="background: linear-gradient(135deg, #2196f3 0%, #00bcd4 100%); color: #fff;">OPCO</a>`
             : '-';
         
         // Lien Pappers pour le dirigeant
-        const dirigeantLink = ent.pappers_url 
-            ? `<a href="${ent.pappers_url}" target="_blank" class="pappers-link" style="background: linear-gradient(135deg, #ff00ff 0%, #8b00ff 100%); color: #fff;">Pappers</a>`
+        const dirigeantLink = pappersUrl 
+            ? `<a href="${pappersUrl}" target="_blank" class="pappers-link" style="background: linear-gradient(135deg, #ff00ff 0%, #8b00ff 100%); color: #fff;">Pappers</a>`
             : '-';
         
         // Déterminer le style de l'état
@@ -305,7 +330,8 @@ async function exportToExcel() {
             headers: {
                 'Content-Type': 'application/json',
             },
-            body: JSON.stringify({ results: resultsWithStatuts })
+            // Résultats de /api/search : seules les entreprises actives y figurent déjà
+            body: JSON.stringify({ results: resultsWithStatuts, already_filtered: true })
         });
         
         if (!response.ok) {
@@ -1,15 +1,24 @@
+import io
 import os
 import re
 from flask import Flask, render_template, request, jsonify, send_file
 from dotenv import load_dotenv
-import pandas as pd
 from datetime import datetime
+from functools import lru_cache
 from typing import List, Dict
 from urllib.parse import quote
 
+import xlsxwriter
+from flask_compress import Compress
+
 from scraper.sirene import SireneClient
 
 app = Flask(__name__)
+# Réponses JSON compactes et compressées (brotli, sinon gzip)
+app.json.compact = True
+app.config["COMPRESS_ALGORITHM"] = ["br", "gzip"]
+app.config["COMPRESS_MIN_SIZE"] = 500
+Compress(app)
 
 # Charger la clé API
 load_dotenv()
@@ -17,6 +26,11 @@ api_key = os.getenv("SIRENE_API_KEY")
 client = SireneClient(api_key=api_key)
 
 
+# Code postal (5 chiffres) dans une adresse
+_POSTAL_RE = re.compile(r"\b(\d{5})\b")
+
+
+@lru_cache(maxsize=1024)
 def generate_pappers_url(siren: str) -> str:
     """Génère une URL de recherche Pappers pour trouver le dirigeant."""
     if not siren or len(siren) < 9:
@@ -36,7 +50,7 @@ def generate_pagesjaunes_url(nom: str, adresse: str) -> str:
 
     code_postal = ""
     if adresse:
-        match = re.search(r"\b(\d{5})\b", adresse)
+        match = _POSTAL_RE.search(adresse)
         if match:
             code_postal = match.group(1)
 
@@ -44,7 +58,8 @@ def generate_pagesjaunes_url(nom: str, adresse: str) -> str:
         # Sans code postal, le lien serait moins précis ; on préfère ne rien mettre
         return ""
 
-    encoded_nom = quote(nom.strip())
+    # Mêmes caractères laissés intacts que encodeURIComponent (static/script.js)
+    encoded_nom = quote(nom.strip(), safe="!'()*")
     return f"https://www.pagesjaunes.fr/recherche/{code_postal}/{encoded_nom}"
 
 
@@ -56,13 +71,105 @@ def generate_opco_url(siret: str) -> str:
     if not siret:
         return ""
     siret = str(siret).strip()
-    if not (siret.isdigit() and len(siret) == 14):
+    # Longueur testée d'abord (O(1)) ; isascii écarte les chiffres Unicode acceptés par isdigit
+    if not (len(siret) == 14 and siret.isascii() and siret.isdigit()):
         return ""
     # Même si le site n'exploite pas encore ce paramètre, ça permet au téléconseiller
     # de voir le SIRET dans l'URL et de le copier/coller facilement.
     return f"https://quel-est-mon-opco.francecompetences.fr/?siret={siret}"
 
 
+# Champs des résultats exportés -> colonnes du fichier Excel, dans l'ordre exact
+EXPORT_COLUMNS = {
+    "nom": "Nom",
+    "adresse": "Adresse",
+    "telephone": "Téléphone",
+    "secteur": "Secteur",
+    "siret": "SIRET",
+    "siren": "SIREN",
+    "effectif": "Effectif",
+    "etat": "État",
+    "statut": "Statut",
+    "date_modification": "Date de modification",
+    "funbooster": "FunBooster",
+    "observation": "Observation",
+    "opco_url": "Lien OPCO (France Compétences)",
+    "pappers_url": "Lien Dirigeant (Pappers)",
+    "pagesjaunes_url": "Lien Téléphone (PagesJaunes)",
+}
+
+# Mise en forme du fichier Excel exporté
+# Style pour les en-têtes
+EXCEL_HEADER_FORMAT = {
+    'bold': True,
+    'font_color': '#FFFFFF',
+    'font_size': 11,
+    'bg_color': '#366092',
+    'align': 'center',
+    'valign': 'vcenter',
+    'text_wrap': True,
+}
+# Alignement du contenu (aligné à gauche, centré verticalement)
+EXCEL_CELL_FORMAT = {
+    'align': 'left',
+    'valign': 'vcenter',
+    'text_wrap': True,
+}
+# Largeur des colonnes, dans l'ordre de EXPORT_COLUMNS
+EXCEL_COLUMN_WIDTHS = (
+    30,  # Nom
+    40,  # Adresse
+    20,  # Téléphone
+    20,  # Secteur
+    18,  # SIRET
+    15,  # SIREN
+    15,  # Effectif
+    15,  # État
+    20,  # Statut
+    25,  # Date de modification
+    20,  # FunBooster
+    30,  # Observation
+    40,  # Lien OPCO (France Compétences)
+    50,  # Lien Dirigeant (Pappers)
+    50,  # Lien Téléphone (PagesJaunes)
+)
+
+
+def _clean(value) -> str:
+    """Valeur saisie côté navigateur -> texte sans espaces superflus ("" si absente)."""
+    return str(value).strip() if value else ""
+
+
+def _export_row(ent: Dict) -> tuple:
+    """
+    Valeurs d'une entreprise dans l'ordre des colonnes de EXPORT_COLUMNS.
+    Les données viennent du navigateur : chaque champ est converti en texte
+    avant de construire les liens ; seuls les champs saisis sont nettoyés.
+    """
+    nom = str(ent.get("nom") or "")
+    adresse = str(ent.get("adresse") or "")
+    siret = str(ent.get("siret") or "")
+    siren = str(ent.get("siren") or "")
+    return (
+        nom,
+        adresse,
+        str(ent.get("telephone") or ""),
+        str(ent.get("secteur") or ""),
+        siret,
+        siren,
+        str(ent.get("effectif") or ""),
+        str(ent.get("etat") or ""),
+        _clean(ent.get("statut")) or "A traiter",
+        _clean(ent.get("date_modification")),
+        _clean(ent.get("funbooster")),
+        _clean(ent.get("observation")),
+        # Liens calculés uniquement pour les lignes exportées
+        generate_opco_url(siret),
+        generate_pappers_url(siren),
+        generate_pagesjaunes_url(nom, adresse),
+    )
+
+
 @app.route('/')
 def index():
     """Page d'accueil avec l'interface de recherche."""
@@ -85,27 +192,16 @@ def search_companies():
             secteur=secteur,
             departement=departement,
             limit=300,
+            active_only=True,
         )
         
-        # Filtrer uniquement les entreprises avec l'état "Actif"
-        active_results = [ent for ent in results if str(ent.get("etat", "")).strip() == "Actif"]
-        
-        # Ajouter les liens Pappers (dirigeant), PagesJaunes (téléphone)
-        # et France Compétences (OPCO) à chaque résultat
-        for ent in active_results:
-            siren = ent.get("siren", "")
-            nom = ent.get("nom", "")
-            adresse = ent.get("adresse", "")
-            siret = ent.get("siret", "")
-            
-            ent["pappers_url"] = generate_pappers_url(siren)
-            ent["pagesjaunes_url"] = generate_pagesjaunes_url(nom, adresse)
-            ent["opco_url"] = generate_opco_url(siret)
+        # Les liens Pappers, PagesJaunes et OPCO sont construits par le navigateur
+        # (static/script.js) : ils ne sont calculés ici que pour l'export Excel
         
         return jsonify({
             'success': True,
-            'count': len(active_results),
-            'results': active_results
+            'count': len(results),
+            'results': results
         })
     
     except Exception as e:
@@ -124,131 +220,46 @@ def export_to_excel():
         if not results:
             return jsonify({'error': 'Aucune donnée à exporter.'}), 400
         
-        # Définir l'ordre exact des colonnes
-        column_order = [
-            "Nom",
-            "Adresse",
-            "Téléphone",
-            "Secteur",
-            "SIRET",
-            "SIREN",
-            "Effectif",
-            "État",
-            "Statut",
-            "Date de modification",
-            "FunBooster",
-            "Observation",
-            "Lien OPCO (France Compétences)",
-            "Lien Dirigeant (Pappers)",
-            "Lien Téléphone (PagesJaunes)",
-        ]
-        
         # Filtrer uniquement les entreprises avec l'état "Actif"
-        active_results = [ent for ent in results if str(ent.get("etat", "")).strip() == "Actif"]
+        # (inutile si le navigateur renvoie tels quels les résultats de /api/search, déjà filtrés)
+        if data.get('already_filtered', False):
+            active_results = results
+        else:
+            active_results = [ent for ent in results if str(ent.get("etat") or "").strip() == "Actif"]
         
         if not active_results:
             return jsonify({'error': 'Aucune entreprise active à exporter.'}), 400
         
-        # Préparer les données pour Excel avec nettoyage
-        excel_data = []
-        for ent in active_results:
-            # Nettoyer et préparer chaque valeur
-            nom = str(ent.get("nom", "")).strip() if ent.get("nom") else ""
-            adresse = str(ent.get("adresse", "")).strip() if ent.get("adresse") else ""
-            telephone = str(ent.get("telephone", "")).strip() if ent.get("telephone") else ""
-            secteur = str(ent.get("secteur", "")).strip() if ent.get("secteur") else ""
-            siret = str(ent.get("siret", "")).strip() if ent.get("siret") else ""
-            siren = str(ent.get("siren", "")).strip() if ent.get("siren") else ""
-            effectif = str(ent.get("effectif", "")).strip() if ent.get("effectif") else ""
-            etat = str(ent.get("etat", "")).strip() if ent.get("etat") else ""
-            statut = str(ent.get("statut", "A traiter")).strip() if ent.get("statut") else "A traiter"
-            date_modification = str(ent.get("date_modification", "")).strip() if ent.get("date_modification") else ""
-            funbooster = str(ent.get("funbooster", "")).strip() if ent.get("funbooster") else ""
-            observation = str(ent.get("observation", "")).strip() if ent.get("observation") else ""
-            opco_url = str(ent.get("opco_url", "")).strip() if ent.get("opco_url") else ""
-            pappers_url = str(ent.get("pappers_url", "")).strip() if ent.get("pappers_url") else ""
-            pagesjaunes_url = str(ent.get("pagesjaunes_url", "")).strip() if ent.get("pagesjaunes_url") else ""
-            
-            excel_data.append({
-                "Nom": nom,
-                "Adresse": adresse,
-                "Téléphone": telephone,
-                "Secteur": secteur,
-                "SIRET": siret,
-                "SIREN": siren,
-                "Effectif": effectif,
-                "État": etat,
-                "Statut": statut,
-                "Date de modification": date_modification,
-                "FunBooster": funbooster,
-                "Observation": observation,
-                "Lien OPCO (France Compétences)": opco_url,
-                "Lien Dirigeant (Pappers)": pappers_url,
-                "Lien Téléphone (PagesJaunes)": pagesjaunes_url,
-            })
-        
-        # Créer un DataFrame avec l'ordre des colonnes spécifié
-        df = pd.DataFrame(excel_data, columns=column_order)
         filename = f"entreprises_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        filepath = os.path.join('temp', filename)
-        
-        # Créer le dossier temp s'il n'existe pas
-        os.makedirs('temp', exist_ok=True)
-        
-        # Exporter vers Excel avec formatage
-        from openpyxl import load_workbook
-        from openpyxl.styles import Font, Alignment, PatternFill
+        # Fichier construit en mémoire puis envoyé directement, sans passer par le disque
+        buffer = io.BytesIO()
         
-        # Créer le fichier Excel
-        df.to_excel(filepath, index=False, engine='openpyxl')
+        # Exporter vers Excel en une seule passe : styles appliqués au fil de l'écriture,
+        # lignes écrites une à une (constant_memory) sans relire le fichier
+        # Les liens sont écrits comme du texte : pas de détection d'URL sur chaque chaîne
+        workbook = xlsxwriter.Workbook(buffer, {'constant_memory': True, 'strings_to_urls': False})
+        ws = workbook.add_worksheet('Entreprises')
+        # Ligne d'en-tête toujours visible lors du défilement
+        ws.freeze_panes(1, 0)
         
-        # Améliorer le formatage du fichier Excel
-        wb = load_workbook(filepath)
-        ws = wb.active
+        # Formats enregistrés une seule fois dans le classeur ; le format du contenu
+        # est porté par les colonnes, les cellules de données n'en reçoivent pas
+        header_format = workbook.add_format(EXCEL_HEADER_FORMAT)
+        cell_format = workbook.add_format(EXCEL_CELL_FORMAT)
+        for col, width in enumerate(EXCEL_COLUMN_WIDTHS):
+            ws.set_column(col, col, width, cell_format)
         
-        # Style pour les en-têtes
-        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF", size=11)
-        header_alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-        
-        # Appliquer le style aux en-têtes
-        for cell in ws[1]:
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = header_alignment
-        
-        # Ajuster la largeur des colonnes automatiquement
-        column_widths = {
-            'A': 30,  # Nom
-            'B': 40,  # Adresse
-            'C': 20,  # Téléphone
-            'D': 20,  # Secteur
-            'E': 18,  # SIRET
-            'F': 15,  # SIREN
-            'G': 15,  # Effectif
-            'H': 15,  # État
-            'I': 20,  # Statut
-            'J': 25,  # Date de modification
-            'K': 20,  # FunBooster
-            'L': 30,  # Observation
-            'M': 40,  # Lien OPCO (France Compétences)
-            'N': 50,  # Lien Dirigeant (Pappers)
-            'O': 50,  # Lien Téléphone (PagesJaunes)
-        }
-        
-        for col, width in column_widths.items():
-            ws.column_dimensions[col].width = width
-        
-        # Alignement du contenu (aligné à gauche, centré verticalement)
-        for row in ws.iter_rows(min_row=2, max_row=ws.max_row):
-            for cell in row:
-                cell.alignment = Alignment(horizontal="left", vertical="center", wrap_text=True)
+        # En-têtes puis données, dans l'ordre des lignes, sans tableau intermédiaire
+        ws.write_row(0, 0, EXPORT_COLUMNS.values(), header_format)
+        for row_idx, ent in enumerate(active_results, 1):
+            ws.write_row(row_idx, 0, _export_row(ent))
         
         # Enregistrer le fichier
-        wb.save(filepath)
+        workbook.close()
+        buffer.seek(0)
         
         return send_file(
-            filepath,
+            buffer,
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
             as_attachment=True,
             download_name=filename
@@ -258,9 +269,6 @@ def export_to_excel():
         return jsonify({'error': f'Erreur lors de l\'export : {str(e)}'}), 500
 
 
-# Créer les dossiers nécessaires au démarrage
-os.makedirs('temp', exist_ok=True)
-
 if __name__ == '__main__':
     print("\n" + "="*50)
     print("🚀 Serveur web démarré !")